@@ -9,10 +9,33 @@ ANTI-CRASH Simmer FastLoop Bot
 import os
 import sys
 import json
+import re
 import time
+import asyncio
+import logging
 import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from urllib.request import urlopen, Request
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+    _loads, _dumps = orjson.loads, orjson.dumps
+except ImportError:  # fall back to stdlib json rather than refusing to start
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj).encode()
+
+try:
+    import websockets
+except ImportError:  # no stream — momentum falls back to REST klines
+    websockets = None
 
 # ===================== SAFE STDOUT =====================
 try:
@@ -20,6 +43,16 @@ try:
 except Exception:
     pass
 
+# ===================== LOGGING =====================
+_log_handler = logging.StreamHandler(sys.stdout)
+_log_handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", datefmt="%H:%M:%S"))
+_log_handler.formatter.converter = time.gmtime  # timestamps stay UTC
+
+logger = logging.getLogger("fastloop")
+logger.addHandler(_log_handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
 # ===================== CONSTANTS =====================
 SIMMER_BASE = os.environ.get("SIMMER_API_BASE", "https://api.simmer.markets")
 
@@ -28,111 +61,255 @@ MAX_TIME_TO_EXPIRY = 120
 
 ASSET_SYMBOL = "BTCUSDT"
 LOOKBACK = 5
+# Seconds before the streamed signal counts as stale. Kept under a minute so
+# a cycle that misses this minute's close falls back to REST rather than
+# reusing last minute's signal.
+KLINE_MAX_AGE = 45
+
+_POLY_URL = (
+    "https://gamma-api.polymarket.com/markets"
+    "?limit=20&closed=false&tag=crypto&order=createdAt&ascending=false"
+)
+_BINANCE_KLINES_URL_FMT = "https://api.binance.com/api/v3/klines?symbol={}&interval=1m&limit={}"
+_BINANCE_KLINE_WS_URL_FMT = "wss://stream.binance.com:9443/ws/{}@kline_1m"
+
+_END_TIME_RE = re.compile(r'(\w+ \d+).*?-\s*(\d{1,2}:\d{2}(AM|PM))')
+_MONTHS = {
+    name: i for i, name in enumerate((
+        "january", "february", "march", "april", "may", "june", "july",
+        "august", "september", "october", "november", "december",
+    ), start=1)
+}
+
+# ===================== HTTP SESSION =====================
+# One pooled keep-alive session for Polymarket, Binance and Simmer:
+# each host keeps its TLS connection open across minute ticks.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0))
+_SESSION.headers["User-Agent"] = "fastloop-bot/1.0"
+# Ask for compressed bodies explicitly (the markets feed shrinks ~7x);
+# requests decompresses them transparently before .content is read.
+_SESSION.headers["Accept-Encoding"] = "gzip"
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# The per-tick GETs never change: prepare them once (URL parse + header merge)
+# and just send them each tick.
+_POLY_REQ = _SESSION.prepare_request(requests.Request("GET", _POLY_URL))
+# One extra row: the newest kline may still be open and is dropped, so REST
+# and the stream both measure LOOKBACK closed candles.
+_BINANCE_REQ = _SESSION.prepare_request(
+    requests.Request("GET", _BINANCE_KLINES_URL_FMT.format(ASSET_SYMBOL, LOOKBACK + 1))
+)
+# Session.send skips the env lookup Session.request does (proxies, CA bundle),
+# so resolve it once per prepared request and pass it on every send.
+_POLY_SEND = _SESSION.merge_environment_settings(_POLY_REQ.url, {}, None, None, None)
+_BINANCE_SEND = _SESSION.merge_environment_settings(_BINANCE_REQ.url, {}, None, None, None)
+
+# Per-tick fetches are I/O-bound; overlap them instead of paying the sum of RTTs.
+_POOL = ThreadPoolExecutor(max_workers=2)
+
+# ===================== KLINE STREAM STATE =====================
+# Rolling (open, close) of the last LOOKBACK closed 1m candles, fed by the
+# websocket thread. The momentum signal over them is computed once per candle
+# close there, so get_binance_momentum only reads it.
+_CANDLES = deque(maxlen=LOOKBACK)
+_CANDLES_LOCK = threading.Lock()
+_stream_signal = None
+_stream_signal_ts = 0.0
+_stream_up = False
+_CANDLE_CLOSED = threading.Event()
+
+_api_key = None
 
 # ===================== UTILS =====================
-def now_utc():
-    return datetime.now(timezone.utc)
-
-
-def sleep_until_next_minute(offset=2):
-    now = now_utc()
-    nxt = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
-    time.sleep(max(0, (nxt - now).total_seconds() + offset))
-
-
-def log(msg):
-    print(f"[{now_utc().strftime('%H:%M:%S')}] {msg}")
+def wait_for_candle_close(offset=2):
+    # Wakes on the stream's closed-candle event. The minute + offset timeout
+    # only paces the loop while the stream is down; while it is up a late
+    # close push must not start a cycle ahead of it. Cleared on wake, so a
+    # close that lands during a timeout-started cycle still triggers one.
+    now = time.time()
+    timeout = 60 - now % 60 + offset
+    if _stream_up:
+        timeout += KLINE_MAX_AGE
+    _CANDLE_CLOSED.wait(timeout)
+    _CANDLE_CLOSED.clear()
 
 
 def get_api_key():
+    # Env lookups only until the key is first found; it never changes after
+    global _api_key
+    if _api_key:
+        return _api_key
     key = os.getenv("SIMMER_API_KEY") or os.getenv("RAILWAY_SIMMER_API_KEY")
     if not key:
-        log("❌ SIMMER_API_KEY not set — sleeping")
+        logger.error("❌ SIMMER_API_KEY not set — sleeping")
         time.sleep(30)
         return None
+    _api_key = key
     return key
 
 
+def safe_fetch(url, method="GET", data=None, headers=None, timeout=10):
+    try:
+        body = None
+        if data:
+            body = _dumps(data)
+            headers = {**_JSON_HEADERS, **(headers or {})}
+        r = _SESSION.request(
+            method, url, data=body, headers=headers, timeout=timeout
+        )
+        r.raise_for_status()
+        return r.content
+    except Exception as e:
+        logger.warning("⚠️ request failed: %s", e)
+        return None
+
+
+def safe_send(prepared, settings, timeout=10):
+    try:
+        r = _SESSION.send(prepared, timeout=timeout, **settings)
+        r.raise_for_status()
+        return r.content
+    except Exception as e:
+        logger.warning("⚠️ request failed: %s", e)
+        return None
+
+
 def safe_request(url, method="GET", data=None, headers=None, timeout=10):
+    raw = safe_fetch(url, method, data, headers, timeout)
+    if raw is None:
+        return None
     try:
-        headers = headers or {}
-        headers.setdefault("User-Agent", "fastloop-bot/1.0")
-        body = json.dumps(data).encode() if data else None
-        req = Request(url, data=body, headers=headers, method=method)
-        with urlopen(req, timeout=timeout) as r:
-            return json.loads(r.read().decode())
+        return _loads(raw)
     except Exception as e:
-        log(f"⚠️ request failed: {e}")
+        logger.warning("⚠️ bad JSON: %s", e)
         return None
 
 
+# The key is fixed for the process lifetime, so the header dict is built once.
+# Shared between calls — never mutate the returned dict.
+@lru_cache(maxsize=4)
+def _auth_headers(api_key):
+    return {"Authorization": f"Bearer {api_key}"}
+
+
 def simmer_request(path, api_key, method="GET", data=None):
-    headers = {"Authorization": f"Bearer {api_key}"}
-    return safe_request(SIMMER_BASE + path, method, data, headers)
+    return safe_request(SIMMER_BASE + path, method, data, _auth_headers(api_key))
 
 
 # ===================== MARKET DISCOVERY =====================
-def parse_end_time(question):
-    import re
-    m = re.search(r'(\w+ \d+).*?-\s*(\d{1,2}:\d{2}(AM|PM))', question or "")
+def parse_end_time(question, year):
+    m = _END_TIME_RE.search(question or "")
     if not m:
         return None
     try:
-        year = now_utc().year
-        dt = datetime.strptime(
-            f"{m.group(1)} {year} {m.group(2)}",
-            "%B %d %Y %I:%M%p"
+        # Manual field parse — strptime is far slower for this fixed format
+        month_name, day = m.group(1).split()
+        hh, mm = m.group(2)[:-2].split(":")
+        hour = int(hh)
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if m.group(3) == "PM" else 0)
+        dt = datetime(
+            year, _MONTHS[month_name.lower()], int(day), hour, int(mm),
+            tzinfo=timezone.utc,
         )
-        return dt.replace(tzinfo=timezone.utc) + timedelta(hours=5)
+        return (dt + timedelta(hours=5)).timestamp()
     except Exception:
         return None
 
 
-def discover_markets():
-    url = (
-        "https://gamma-api.polymarket.com/markets"
-        "?limit=20&closed=false&tag=crypto&order=createdAt&ascending=false"
-    )
-    data = safe_request(url)
+# The same questions repeat tick after tick, so the filter and the parse are
+# cached together; year is part of the key so results stay correct across a
+# New Year rollover.
+@lru_cache(maxsize=512)
+def market_end_time(question, year):
+    if "bitcoin up or down" not in question.lower():
+        return None
+    return parse_end_time(question, year)
+
+
+def find_tradeable_market():
+    raw = safe_send(_POLY_REQ, _POLY_SEND)
+    # One clock read per tick, taken after the fetch so its latency doesn't
+    # inflate the remaining time; end times are UNIX timestamps
+    now = time.time()
+    # Off-hours the feed often has no BTC up/down market at all; reject
+    # the body before building any Python objects from it.
+    if not raw or b"bitcoin up or down" not in raw.lower():
+        return None
+    try:
+        data = _loads(raw)
+    except Exception as e:
+        logger.warning("⚠️ bad JSON: %s", e)
+        return None
     if not isinstance(data, list):
-        return []
+        return None
 
-    markets = []
+    # Single pass: cached question filter + end-time parse, then the
+    # expiry window — first market inside it wins.
+    year = time.gmtime(now).tm_year
     for m in data:
-        q = (m.get("question") or "").lower()
-        if "bitcoin up or down" not in q:
-            continue
-        end_time = parse_end_time(m.get("question"))
-        markets.append({
-            "slug": m.get("slug"),
-            "question": m.get("question"),
-            "end_time": end_time,
-            "outcome_prices": m.get("outcomePrices"),
-        })
-    return markets
-
-
-def select_market(markets):
-    now = now_utc()
-    for m in markets:
-        if not m["end_time"]:
+        question = m.get("question") or ""
+        end_time = market_end_time(question, year)
+        if not end_time:
             continue
-        rem = (m["end_time"] - now).total_seconds()
-        if MIN_TIME_TO_EXPIRY < rem <= MAX_TIME_TO_EXPIRY:
-            return m
+        if now + MIN_TIME_TO_EXPIRY < end_time <= now + MAX_TIME_TO_EXPIRY:
+            return {
+                "slug": m.get("slug"),
+                "question": question,
+                "end_time": end_time,
+                "outcome_prices": m.get("outcomePrices"),
+            }
     return None
 
 
-# ===================== SIGNAL =====================
-def get_binance_momentum():
-    url = f"https://api.binance.com/api/v3/klines?symbol={ASSET_SYMBOL}&interval=1m&limit={LOOKBACK}"
-    candles = safe_request(url)
-    if not isinstance(candles, list) or len(candles) < 2:
-        return None
+# ===================== KLINE STREAM =====================
+async def _kline_stream():
+    global _stream_signal, _stream_signal_ts, _stream_up
+    url = _BINANCE_KLINE_WS_URL_FMT.format(ASSET_SYMBOL.lower())
+    backoff = 1
+    while True:
+        try:
+            async with websockets.connect(url, ping_interval=20) as ws:
+                logger.info("📡 kline stream connected")
+                _stream_up = True
+                backoff = 1
+                with _CANDLES_LOCK:
+                    _CANDLES.clear()  # candles may have been missed while down
+                    _stream_signal = None
+                async for msg in ws:
+                    k = _loads(msg).get("k") or {}
+                    if not k.get("x"):
+                        continue
+                    candle = (float(k["o"]), float(k["c"]))
+                    with _CANDLES_LOCK:
+                        _CANDLES.append(candle)
+                        if len(_CANDLES) == LOOKBACK:
+                            _stream_signal = _momentum(_CANDLES[0][0], _CANDLES[-1][1])
+                            _stream_signal_ts = time.time()
+                    _CANDLE_CLOSED.set()
+        except Exception as e:
+            logger.warning("⚠️ kline stream error: %s", e)
+        _stream_up = False
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+def start_kline_stream():
+    if websockets is None:
+        logger.warning("⚠️ websockets not installed — using REST klines")
+        return
+    threading.Thread(
+        target=lambda: asyncio.run(_kline_stream()),
+        name="kline-stream",
+        daemon=True,
+    ).start()
+
 
+# ===================== SIGNAL =====================
+def _momentum(open_p, close_p):
     try:
-        open_p = float(candles[0][1])
-        close_p = float(candles[-1][4])
         pct = (close_p - open_p) / open_p * 100
         return {
             "pct": pct,
@@ -142,54 +319,102 @@ def get_binance_momentum():
         return None
 
 
+def _stream_momentum():
+    with _CANDLES_LOCK:
+        if time.time() - _stream_signal_ts > KLINE_MAX_AGE:
+            return None
+        return _stream_signal
+
+
+def _rest_open_close():
+    raw = safe_send(_BINANCE_REQ, _BINANCE_SEND)
+    if not raw or raw[:1] != b"[":
+        return None
+
+    try:
+        # Klines rows are flat arrays, so the body splits into raw rows and
+        # only the rows actually needed are decoded.
+        rows = raw[2:-2].split(b"],[")
+        last = _loads(b"[" + rows[-1] + b"]")
+        if last[6] >= time.time() * 1000:  # close time not reached: still open
+            rows.pop()
+            last = None
+        window = rows[-LOOKBACK:]
+        if len(window) < LOOKBACK:
+            return None
+        first = _loads(b"[" + window[0] + b"]")
+        if last is None:
+            last = _loads(b"[" + window[-1] + b"]")
+        return float(first[1]), float(last[4])
+    except Exception:
+        return None
+
+
+def get_binance_momentum():
+    # Streamed signal needs no network I/O or float parsing; REST covers
+    # startup and outages
+    signal = _stream_momentum()
+    if signal:
+        return signal
+    oc = _rest_open_close()
+    return _momentum(*oc) if oc else None
+
+
 # ===================== STRATEGY =====================
 def run_cycle():
     api_key = get_api_key()
     if not api_key:
         return
 
-    markets = discover_markets()
-    if not markets:
-        log("⏸ no markets")
-        return
+    # Discovery and momentum prefetch run concurrently
+    market_f = _POOL.submit(find_tradeable_market)
+    signal_f = _POOL.submit(get_binance_momentum)
 
-    market = select_market(markets)
+    market = market_f.result()
     if not market:
-        log("⏸ no market in 60–120s window")
+        logger.info("⏸ no market in 60–120s window")
         return
 
     # Safe price parse
     try:
         raw = market["outcome_prices"]
-        prices = raw if isinstance(raw, list) else json.loads(raw or "[]")
+        prices = raw if isinstance(raw, list) else _loads(raw or "[]")
         yes_price = float(prices[0]) if prices else 0.5
     except Exception:
         yes_price = 0.5
 
-    signal = get_binance_momentum()
+    signal = signal_f.result()
     if not signal:
-        log("⚠️ no momentum data")
+        logger.warning("⚠️ no momentum data")
         return
 
     if abs(signal["pct"]) < 0.5:
-        log("⏸ weak momentum")
+        logger.info("⏸ weak momentum")
         return
 
     side = "YES" if signal["dir"] == "up" else "NO"
-    log(f"🎯 SIGNAL {side} | momentum {signal['pct']:+.2f}% | YES {yes_price:.3f}")
+    logger.info(
+        "🎯 SIGNAL %s | momentum %+.2f%% | YES %.3f", side, signal["pct"], yes_price
+    )
 
     # 👉 Tại đây bạn gắn trade thật nếu muốn
 
 
 # ===================== MAIN LOOP =====================
 def main():
-    log("🚀 FastLoop ANTI-CRASH started")
+    logger.info("🚀 FastLoop ANTI-CRASH started")
+    start_kline_stream()
+    last_minute = None
     while True:
-        try:
-            run_cycle()
-        except Exception as e:
-            log(f"🔥 UNCAUGHT ERROR: {e}")
-        sleep_until_next_minute(offset=2)
+        # At most one cycle per minute, however the wake-ups line up
+        minute = int(time.time() // 60)
+        if minute != last_minute:
+            last_minute = minute
+            try:
+                run_cycle()
+            except Exception as e:
+                logger.exception("🔥 UNCAUGHT ERROR: %s", e)
+        wait_for_candle_close(offset=2)
 
 
 if __name__ == "__main__":